@@ -1,10 +1,10 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import numpy as np
+import plotly.graph_objects as go
 from datetime import datetime
-from collections import defaultdict
 import io
 import re
+import functools
 
 # Initialize session state for tracking plotting status and stored plots
 if 'stored_plots' not in st.session_state:
@@ -14,111 +14,444 @@ if 'is_plotting' not in st.session_state:
 if 'current_id' not in st.session_state:
     st.session_state.current_id = None
 
-# Define a color palette with a range of colors
+# Define a color palette with a range of colors; stored plots cycle through
+# it, wrapping back to the first color after the tenth plot
 color_palette = [
     '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b',
-    '#e377c2', '#7f7f7f', '#bcbd22', '#17becf', '#1f77b4', '#ff7f0e',
-    '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f'
+    '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
 ]
 
-# Function to extract data from the uploaded file
-def extract_data(file):
-    data = defaultdict(lambda: defaultdict(list))
-    try:
-        buffer = io.StringIO(file.read().decode('utf-8'))
-        lines = buffer.readlines()
+# Patterns used to parse each line of the CAN bus data file; each one is
+# searched for anywhere on the line, so 'Frame ID: 0x1' switches the CAN ID
+# and 'Motor Speed: 10rpm' is stored under 'Speed'. An ID anywhere on a line
+# wins over 'Data Bytes', which wins over a generic measurement.
+# Python's re is used on purpose: with google-re2 the per-match overhead of
+# its Python wrapper made parsing about 25x slower on CAN dumps, whose lines
+# are far too short for a DFA engine's scan speed to pay off.
+CAN_ID_RE = re.compile(r'ID:\s*(0x[0-9A-Fa-f]+)')
+DATA_BYTES_RE = re.compile(r'Data Bytes:\s*(.*)')
+MEASUREMENT_RE = re.compile(r'(\w+):\s*(.*)')
 
-        can_id_pattern = re.compile(r'ID:\s*(0x[0-9A-Fa-f]+)')
-        data_bytes_pattern = re.compile(r'Data Bytes:\s*(.*)')
-        measurement_pattern = re.compile(r'(\w+):\s*(.*)')
+# Unit suffix stripped from measurement values before converting them
+UNIT_SUFFIX_RE = re.compile(r'(?:A|rpm|deg|Nm)\s*$')
 
-        current_id = None
-        for line in lines:
-            id_match = can_id_pattern.search(line)
-            if id_match:
-                current_id = id_match.group(1)
+# Hex decoder for Data Bytes payloads, compiled with Numba by hex_decoder().
+# buf holds the ASCII text of every payload back to back and
+# offsets[i]:offsets[i + 1] delimits row i. Each whitespace-separated token is
+# one byte of one or two hex digits, with an optional 0x prefix. Returns the
+# payloads zero-padded to the longest one, the number of bytes in each row,
+# and the index of the first row holding a malformed token (-1 when every row
+# decoded).
+def parse_hex_batch(buf, offsets):
+    n = offsets.size - 1
+
+    # First pass: count the tokens in each row to size the output
+    lengths = np.zeros(n, dtype=np.int64)
+    width = 0
+    for i in range(n):
+        count = 0
+        in_token = False
+        for j in range(offsets[i], offsets[i + 1]):
+            c = buf[j]
+            if c == 32 or (9 <= c <= 13):
+                in_token = False
+            elif not in_token:
+                in_token = True
+                count += 1
+        lengths[i] = count
+        width = max(width, count)
+
+    # Second pass: decode each token into one byte
+    out = np.zeros((n, width), dtype=np.uint8)
+    for i in range(n):
+        col = 0
+        j = offsets[i]
+        end = offsets[i + 1]
+        while j < end:
+            c = buf[j]
+            if c == 32 or (9 <= c <= 13):
+                j += 1
                 continue
 
-            bytes_match = data_bytes_pattern.search(line)
-            if bytes_match and current_id:
-                data_bytes = bytes_match.group(1)
-                values = [int(b, 16) for b in data_bytes.split()]
-                data[current_id]['Data Bytes'].append(values)
+            start = j
+            while j < end and not (buf[j] == 32 or (9 <= buf[j] <= 13)):
+                j += 1
+            if j - start > 2 and buf[start] == 48 and (buf[start + 1] == 120 or buf[start + 1] == 88):
+                start += 2
+            if j - start > 2:
+                return out, lengths, i
+
+            value = 0
+            for k in range(start, j):
+                c = buf[k]
+                if 48 <= c <= 57:
+                    value = value * 16 + c - 48
+                elif 65 <= c <= 70:
+                    value = value * 16 + c - 55
+                elif 97 <= c <= 102:
+                    value = value * 16 + c - 87
+                else:
+                    return out, lengths, i
+            out[i, col] = value
+            col += 1
+    return out, lengths, -1
+
+# Function to compile parse_hex_batch on first use; numba is imported here so
+# starting the app does not pay for it, and cache=True keeps the compiled code
+# on disk for later sessions. Numba names the cache files in __pycache__ after
+# the line parse_hex_batch is defined on, so editing code above it leaves the
+# old streamlit_app.parse_hex_batch-<line>.* files behind; they are never read
+# again and can be deleted along with the rest of __pycache__.
+@functools.lru_cache(maxsize=None)
+def hex_decoder():
+    from numba import njit
+    return njit(cache=True)(parse_hex_batch)
+
+# Function to decode a list of 'Data Bytes' hex strings into a zero-padded
+# uint8 matrix and the byte count of each payload
+def decode_data_bytes(rows):
+    buf = np.frombuffer(bytearray(''.join(rows).encode('ascii', 'replace')), dtype=np.uint8)
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    payloads, lengths, bad_row = hex_decoder()(buf, offsets)
+    if bad_row >= 0:
+        raise ValueError(f"invalid Data Bytes payload: {rows[bad_row]!r}")
+    return payloads, lengths
+
+# Structure-of-arrays store for the parsed CAN data. Each CAN ID owns one
+# contiguous float32 array per measurement; the arrays are filled
+# independently and keep their own length, so a measurement missing from some
+# frames does not shift the others.
+class CanStore:
+    def __init__(self):
+        self.frames = {}
+
+    def add_id(self, can_id):
+        entry = self.frames.get(can_id)
+        if entry is None:
+            entry = self.frames[can_id] = {
+                'cols': {},
+                'n': {},
+                'bytes': None,
+                'byte_counts': None,
+            }
+        return entry
+
+    def extend(self, can_id, key, values):
+        values = np.asarray(values, dtype=np.float32)
+        entry = self.add_id(can_id)
+        cols = entry['cols']
+        buf = cols.get(key)
+        if buf is None:
+            buf = cols[key] = np.empty(0, dtype=np.float32)
+            entry['n'][key] = 0
+
+        start = entry['n'][key]
+        end = start + len(values)
+        if end > buf.size:
+            # Grow geometrically so repeated batches stay amortized O(1)
+            grown = np.empty(max(end, 2 * buf.size), dtype=np.float32)
+            grown[:start] = buf[:start]
+            buf = cols[key] = grown
+        buf[start:end] = values
+        entry['n'][key] = end
+
+    def set_data_bytes(self, can_id, payloads, byte_counts):
+        entry = self.add_id(can_id)
+        entry['bytes'] = payloads
+        entry['byte_counts'] = byte_counts
+
+    def data_bytes(self, can_id):
+        # Zero-padded payload matrix and the real byte count of each frame
+        entry = self.frames[can_id]
+        return entry['bytes'], entry['byte_counts']
+
+    def ids(self):
+        return list(self.frames)
+
+    def measurements(self, can_id):
+        return list(self.frames[can_id]['cols'])
+
+    def column(self, can_id, key):
+        entry = self.frames[can_id]
+        return entry['cols'][key][:entry['n'][key]]
+
+    def __len__(self):
+        return len(self.frames)
+
+# Number of characters decoded from the upload per parsed block
+CHUNK_CHARS = 1 << 20
+
+# Function to decode the uploaded bytes in blocks of complete lines; each
+# block is cut at its last newline and the partial line carried over
+def iter_blocks(file_bytes):
+    stream = io.TextIOWrapper(io.BytesIO(file_bytes), encoding='utf-8')
+    tail = ''
+    while True:
+        block = stream.read(CHUNK_CHARS)
+        if not block:
+            break
+        text = tail + block
+        cut = text.rfind('\n') + 1
+        tail = text[cut:]
+        yield text[:cut]
+    yield tail
+
+# Function to parse one block of complete lines into store, collecting the raw
+# 'Data Bytes' strings per CAN ID in payloads; returns the last CAN ID seen
+def extract_chunk(text, current_id, store, payloads):
+    pending = {}
+    strip_unit = UNIT_SUFFIX_RE.sub
+    # Bound append methods of the lists being filled, per CAN ID and keyed by
+    # measurement (None for the raw 'Data Bytes' strings); they are looked up
+    # when the ID changes instead of resolving the lists on every line
+    appends_by_id = {}
+    appends = appends_by_id.get(current_id)
+    id_search = CAN_ID_RE.search
+    bytes_search = DATA_BYTES_RE.search
+    measurement_search = MEASUREMENT_RE.search
+    for line in text.split('\n'):
+        # The substring checks run in C and let most lines skip the ID and
+        # Data Bytes patterns entirely
+        m = id_search(line) if 'ID:' in line else None
+        if m:
+            current_id = m[1]
+            appends = appends_by_id.get(current_id)
+            continue
+        if current_id is None:
+            continue
+
+        m = bytes_search(line) if 'Data Bytes:' in line else None
+        if m:
+            # Keep the raw hex strings; they are decoded in one batch per ID
+            # once the whole file has been read
+            key = None
+            value = m[1]
+        else:
+            m = measurement_search(line)
+            if not m:
                 continue
+            key, value = m.groups()
+            try:
+                value = float(strip_unit('', value))
+            except ValueError:
+                continue
+
+        if appends is None:
+            appends = appends_by_id[current_id] = {}
+            pending[current_id] = {}
+        append = appends.get(key)
+        if append is None:
+            if key is None:
+                append = payloads.setdefault(current_id, []).append
+            else:
+                append = pending[current_id].setdefault(key, []).append
+            appends[key] = append
+        append(value)
+
+    for can_id, measurements in pending.items():
+        store.add_id(can_id)
+        for key, values in measurements.items():
+            store.extend(can_id, key, values)
 
-            measurement_match = measurement_pattern.search(line)
-            if measurement_match and current_id:
-                key, value = measurement_match.groups()
-                try:
-                    value = float(value.replace('A', '').replace('rpm', '').replace('deg', '').replace('Nm', ''))
-                except ValueError:
-                    continue
-                data[current_id][key].append(value)
+    return current_id
+
+# Function to extract data from the uploaded file; cached on the file contents
+# so widget interactions do not re-parse the upload on every rerun
+@st.cache_data(show_spinner=False)
+def extract_data(file_bytes):
+    data = CanStore()
+    payloads = {}
+    try:
+        # Parse the blocks into the store; decoding lazily keeps only one
+        # block of text in memory at a time
+        current_id = None
+        for text in iter_blocks(file_bytes):
+            current_id = extract_chunk(text, current_id, data, payloads)
+
+        for can_id, rows in payloads.items():
+            data.set_data_bytes(can_id, *decode_data_bytes(rows))
 
     except Exception as e:
         st.error(f"Error reading the file: {e}")
     return data
 
+# Width of the plots in pixels, also the target bucket count for downsampling
+PLOT_WIDTH = 700
+
+# Chart types whose series are downsampled with M4 before plotting
+M4_CHARTS = {'Line Chart', 'Scatter Plot', 'Area Chart'}
+
+# Function to downsample a series with M4 aggregation: the values are split
+# into buckets of roughly one pixel each and only the first, last, minimum and
+# maximum point of every bucket is kept, which draws the same line at the
+# plot's width. The bucket size is rounded down to a power of two so the
+# bucket boundaries stay stable. Returns the kept indices and their values.
+def m4_downsample(values, width=PLOT_WIDTH):
+    n = values.size
+    if n <= 4 * width:
+        return np.arange(n), values
+
+    bucket = n // width
+    bucket = 1 << (bucket.bit_length() - 1)
+    buckets = n // bucket
+    starts = np.arange(buckets) * bucket
+
+    blocks = values[:buckets * bucket].reshape(buckets, bucket)
+    picks = np.stack([
+        starts,
+        starts + blocks.argmin(axis=1),
+        starts + blocks.argmax(axis=1),
+        starts + bucket - 1,
+    ], axis=1)
+    # Sorting within each bucket keeps the indices increasing; the points left
+    # over after the last full bucket are kept as they are
+    index = np.concatenate([np.unique(picks), np.arange(buckets * bucket, n)])
+    return index, values[index]
+
+# Chart builders, one per chart type. Traces are built directly from the
+# arrays, skipping the DataFrame that Plotly Express would construct;
+# line-style charts use WebGL traces.
+INDEX_AXES = {'xaxis_title': 'Index', 'yaxis_title': 'Value'}
+
+def build_line_chart(index, values):
+    trace = go.Scattergl(x=index, y=values, mode='lines')
+    return go.Figure(trace).update_layout(**INDEX_AXES)
+
+def build_bar_chart(index, values):
+    trace = go.Bar(x=index, y=values)
+    return go.Figure(trace).update_layout(**INDEX_AXES)
+
+def build_scatter_plot(index, values):
+    trace = go.Scattergl(x=index, y=values, mode='markers')
+    return go.Figure(trace).update_layout(**INDEX_AXES)
+
+def build_area_chart(index, values):
+    trace = go.Scattergl(x=index, y=values, mode='lines', fill='tozeroy')
+    return go.Figure(trace).update_layout(**INDEX_AXES)
+
+# The histogram, box plot and pie chart are aggregated here with NumPy so
+# only the summary is sent to the browser rather than every sample. The
+# histogram and box plot only aggregate finite values, since the parser
+# accepts 'nan' and 'inf' and float32 overflows to inf.
+HISTOGRAM_BINS = 50
+
+def empty_figure(axis_titles):
+    fig = go.Figure().update_layout(**axis_titles)
+    fig.add_annotation(text="No finite values to plot", showarrow=False,
+                       xref='paper', yref='paper', x=0.5, y=0.5)
+    return fig
+
+def build_histogram(index, values):
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return empty_figure({'xaxis_title': 'Value', 'yaxis_title': 'count'})
+
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    trace = go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges))
+    return go.Figure(trace).update_layout(xaxis_title='Value', yaxis_title='count', bargap=0)
+
+def build_box_plot(index, values):
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return empty_figure({'yaxis_title': 'Value'})
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    # Whiskers reach the furthest samples within 1.5 IQR of the box, as
+    # Plotly draws them when it computes the box itself; only the samples
+    # beyond the whiskers are sent, as the box's sample points, so the
+    # outliers are still drawn
+    iqr = q3 - q1
+    lowerfence = values[values >= q1 - 1.5 * iqr].min()
+    upperfence = values[values <= q3 + 1.5 * iqr].max()
+    outliers = values[(values < lowerfence) | (values > upperfence)]
+    trace = go.Box(
+        q1=[q1], median=[median], q3=[q3],
+        lowerfence=[lowerfence], upperfence=[upperfence],
+        y=[outliers.tolist()], boxpoints='outliers'
+    )
+    return go.Figure(trace).update_layout(yaxis_title='Value')
+
+def build_heatmap(index, values):
+    trace = go.Histogram2d(x=index.astype(str), y=values, colorscale='Viridis')
+    return go.Figure(trace).update_layout(**INDEX_AXES)
+
+def build_pie_chart(index, values):
+    names, counts = np.unique(values, return_counts=True)
+    # Format the labels to float32 precision so they read as they were logged
+    return go.Figure(go.Pie(values=counts, labels=np.char.mod('%.7g', names)))
+
+CHART_BUILDERS = {
+    'Line Chart': build_line_chart,
+    'Bar Chart': build_bar_chart,
+    'Scatter Plot': build_scatter_plot,
+    'Area Chart': build_area_chart,
+    'Histogram': build_histogram,
+    'Box Plot': build_box_plot,
+    'Heatmap': build_heatmap,
+    'Pie Chart': build_pie_chart,
+}
+
+# Trace property that takes the plot's palette color, per chart type. The
+# color is applied after build_figure so it is not part of the cache key; the
+# heatmap and pie chart keep their own color scales.
+CHART_COLORS = {
+    'Line Chart': 'line',
+    'Bar Chart': 'marker',
+    'Scatter Plot': 'marker',
+    'Area Chart': 'line',
+    'Histogram': 'marker',
+    'Box Plot': 'marker',
+}
+
+# Function to build the Plotly figure for one measurement; cached so reruns
+# that plot the same values reuse the figure instead of rebuilding it.
+# st.cache_data hands back a copy, so callers may restyle it freely.
+# Returns None for an unsupported chart type.
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_figure(measurement, chart_type, index, values):
+    builder = CHART_BUILDERS.get(chart_type)
+    if builder is None:
+        return None
+
+    fig = builder(index, values)
+    fig.update_layout(title=f'{chart_type} for {measurement}', width=PLOT_WIDTH, height=400)
+    return fig
+
 # Function to plot data using Plotly
 def plot_data(selected_id, selected_measurement, data, chart_type):
     st.session_state.is_plotting = True
-    with st.spinner('Plotting data...'):
-        # Simulate plotting time for demonstration
-        import time
-        time.sleep(2)
-        
-        if not selected_measurement:
-            st.write("No measurement selected for plotting.")
-            st.session_state.is_plotting = False
-            return
-
-        measurement = selected_measurement
-        values = data[selected_id][measurement]
-        if values:
-            df = pd.DataFrame({
-                'Index': list(range(len(values))),
-                'Value': values
-            })
-
-            # Determine color for this plot
-            color_index = len(st.session_state.stored_plots) % len(color_palette)
-            color = color_palette[color_index]
-
-            if chart_type == 'Line Chart':
-                fig = px.line(df, x='Index', y='Value', title=f'Line Chart for {measurement}', 
-                              line_shape='linear', color_discrete_sequence=[color])
-            elif chart_type == 'Bar Chart':
-                fig = px.bar(df, x='Index', y='Value', title=f'Bar Chart for {measurement}', 
-                             color_discrete_sequence=[color])
-            elif chart_type == 'Scatter Plot':
-                fig = px.scatter(df, x='Index', y='Value', title=f'Scatter Plot for {measurement}', 
-                                color_discrete_sequence=[color])
-            elif chart_type == 'Area Chart':
-                fig = px.area(df, x='Index', y='Value', title=f'Area Chart for {measurement}', 
-                              color_discrete_sequence=[color])
-            elif chart_type == 'Histogram':
-                fig = px.histogram(df, x='Value', title=f'Histogram for {measurement}', 
-                                   color_discrete_sequence=[color])
-            elif chart_type == 'Box Plot':
-                fig = px.box(df, y='Value', title=f'Box Plot for {measurement}', 
-                             color_discrete_sequence=[color])
-            elif chart_type == 'Heatmap':
-                df['Index'] = df['Index'].astype(str)
-                fig = px.density_heatmap(df, x='Index', y='Value', title=f'Heatmap for {measurement}', 
-                                        color_continuous_scale='Viridis')
-            elif chart_type == 'Pie Chart':
-                df = df.groupby('Value').size().reset_index(name='Count')
-                fig = px.pie(df, values='Count', names='Value', title=f'Pie Chart for {measurement}')
-            else:
-                st.write(f"Unsupported chart type: {chart_type}")
-                st.session_state.is_plotting = False
+    try:
+        with st.spinner('Plotting data...'):
+            if not selected_measurement:
+                st.write("No measurement selected for plotting.")
                 return
 
-            fig.update_layout(width=700, height=400)
+            measurement = selected_measurement
+            values = data.column(selected_id, measurement)
+            if values.size:
+                # Determine color for this plot
+                color_index = len(st.session_state.stored_plots) % len(color_palette)
+                color = color_palette[color_index]
+
+                if chart_type in M4_CHARTS:
+                    index, values = m4_downsample(values)
+                else:
+                    index = np.arange(values.size)
+
+                fig = build_figure(measurement, chart_type, index, values)
+                if fig is None:
+                    st.write(f"Unsupported chart type: {chart_type}")
+                    return
+
+                color_property = CHART_COLORS.get(chart_type)
+                if color_property:
+                    fig.update_traces({color_property: {'color': color}})
 
-            # Store the plot in session state
-            st.session_state.stored_plots.append(fig)
-        
+                # Store the plot in session state
+                st.session_state.stored_plots.append(fig)
+    finally:
+        # Clear the flag on every exit path, including errors
         st.session_state.is_plotting = False
 
 # Main function to handle the Streamlit app logic
@@ -129,10 +462,10 @@ def main():
     uploaded_file = st.file_uploader("Upload a CAN bus data file", type="txt")
 
     if uploaded_file is not None:
-        data = extract_data(uploaded_file)
+        data = extract_data(uploaded_file.getvalue())
 
         if data:
-            unique_ids = list(data.keys())
+            unique_ids = data.ids()
             st.write("Unique CAN IDs:")
             st.write(sorted(unique_ids))
 
@@ -144,16 +477,12 @@ def main():
                 st.session_state.current_id = selected_id
 
             if selected_id:
-                measurements = data[selected_id]
-                measurement_names = [key for key in measurements.keys() if key != 'Data Bytes']
+                measurement_names = data.measurements(selected_id)
                 
                 st.write("Select measurement to plot:")
                 selected_measurement = st.radio("Measurement", measurement_names, key="measurement_selection")
 
-                chart_type = st.selectbox("Select chart type", [
-                    'Line Chart', 'Bar Chart', 'Scatter Plot', 'Area Chart',
-                    'Histogram', 'Box Plot', 'Heatmap', 'Pie Chart'
-                ])
+                chart_type = st.selectbox("Select chart type", list(CHART_BUILDERS))
 
                 if st.session_state.is_plotting:
                     st.write("Please wait, the graph is being plotted...")